@@ -6,6 +6,9 @@ import pandas as pd
 import os
 import numpy as np
 import plotly.express as px
+import plotly.graph_objects as go
+import pyarrow as pa
+import pyarrow.csv as pacsv
 
 # setup page
 st.set_page_config(
@@ -17,29 +20,60 @@ st.set_page_config(
 px.defaults.template = "plotly_white" # Plotly default style
 
 # Load data
-@st.cache_data(show_spinner=False)
-def load_data():
-    if os.path.exists("Food_Delivery_Times_CLEAN.csv"):
-        df = pd.read_csv("Food_Delivery_Times_CLEAN.csv")
+CAT_COLS = ["Weather", "Traffic_Level", "Time_of_Day", "Vehicle_Type"]
+NUM_COLS = ["Distance_km", "Courier_Experience_yrs", "Delivery_Time_min"]
+INT_COLS = ["Delivery_Time_min"]  # integer minutes in the source CSVs
+PARQUET_PATH = "Food_Delivery_Times_CLEAN.parquet"
+
+def read_csv(path, **column_types):
+    # pyarrow's multithreaded reader, empty cells become NaN like pd.read_csv
+    opts = pacsv.ConvertOptions(column_types=column_types, strings_can_be_null=True)
+    return pacsv.read_csv(path, convert_options=opts).to_pandas()
+
+def canonicalize(df):
+    # categorical strings + float32 numerics keep the cached frame small;
+    # plotly>=6 also ships float32 columns to the browser as base64 f4 arrays
+    df = df.astype({c: "category" for c in CAT_COLS if c in df.columns})
+    num = [c for c in NUM_COLS if c in df.columns]
+    df[num] = df[num].astype("float32")
+    return df
+
+def source_version():
+    # mtimes of the source CSVs; part of every data cache key so edits are picked up
+    return tuple(
+        os.path.getmtime(p) if os.path.exists(p) else None
+        for p in ("Food_Delivery_Times_CLEAN.csv", "Food_Delivery_Times.csv")
+    )
+
+@st.cache_data(persist="disk", show_spinner=False)
+def load_data(data_version):
+    # the parquet copy is only valid next to the CSV it was built from
+    if (
+        os.path.exists("Food_Delivery_Times_CLEAN.csv") and os.path.exists(PARQUET_PATH)
+        and os.path.getmtime(PARQUET_PATH) >= os.path.getmtime("Food_Delivery_Times_CLEAN.csv")
+    ):
+        return pd.read_parquet(PARQUET_PATH), "CLEAN"
+    elif os.path.exists("Food_Delivery_Times_CLEAN.csv"):
+        df = canonicalize(read_csv(
+            "Food_Delivery_Times_CLEAN.csv", **{c: pa.float32() for c in NUM_COLS}
+        ))
+        # parse the CSV only once, later cold starts read the parquet copy
+        try:
+            df.to_parquet(PARQUET_PATH, compression="zstd", index=False)
+        except OSError:
+            pass  # read-only folder: keep serving from the CSV
         return df, "CLEAN"
     elif os.path.exists("Food_Delivery_Times.csv"):
         # fallback minimal clean
-        df = pd.read_csv("Food_Delivery_Times.csv")
+        df = read_csv("Food_Delivery_Times.csv")
         df.columns = [c.strip() for c in df.columns]
-        for c in ["Distance_km", "Courier_Experience_yrs", "Delivery_Time_min"]:
+        for c in NUM_COLS:
             if c in df.columns:
-                df[c] = pd.to_numeric(df[c], errors="coerce")
+                df[c] = pd.to_numeric(df[c], errors="coerce", downcast="float")
         # english title case normalization 
-        def norm(s): return s.astype(str).str.strip().str.lower()
-        maps = {
-            "Weather": {"sunny":"Sunny","rainy":"Rainy","snowy":"Snowy","foggy":"Foggy","windy":"Windy"},
-            "Traffic_Level": {"low":"Low","medium":"Medium","high":"High"},
-            "Time_of_Day": {"morning":"Morning","afternoon":"Afternoon","evening":"Evening","night":"Night"},
-            "Vehicle_Type": {"bike":"Bike","scooter":"Scooter","car":"Car"},
-        }
-        for col, mp in maps.items():
+        for col in CAT_COLS:
             if col in df.columns:
-                df[col] = norm(df[col]).map(mp).fillna(df[col])
+                df[col] = df[col].astype("string").str.strip().str.title()
         df = df[~df["Delivery_Time_min"].isna()].copy()
         # Simple imputation, that the graphics are error free
         for c in ["Distance_km", "Courier_Experience_yrs"]:
@@ -47,14 +81,15 @@ def load_data():
                 df[c] = df[c].fillna(df[c].median())
         for c in ["Weather","Traffic_Level","Time_of_Day","Vehicle_Type"]:
             if c in df.columns and df[c].isna().sum() > 0:
-                m = df[c].mode(dropna=True)
-                if len(m): df[c] = df[c].fillna(m.iloc[0])
-        return df, "RAW (auto-clean)"
+                vc = df[c].value_counts(dropna=True)
+                if not vc.empty: df[c] = df[c].fillna(vc.index[0])
+        return canonicalize(df), "RAW (auto-clean)"
     else:
         st.error("Put 'Food_Delivery_Times_CLEAN.csv' or 'Food_Delivery_Times.csv' in the same folder.")
         st.stop()
 
-df, src = load_data()
+data_version = source_version()
+df, src = load_data(data_version)
 
 needed = ["Delivery_Time_min","Distance_km","Courier_Experience_yrs",
           "Weather","Traffic_Level","Time_of_Day","Vehicle_Type"]
@@ -63,6 +98,9 @@ if missing:
     st.error(f"Required fields are missing: {missing}")
     st.stop()
 
+# fixed category order per column, read once from the categorical dtype
+CATEGORY_ORDERS = {c: list(df[c].cat.categories) for c in CAT_COLS}
+
 # Color palettes
 COLOR_WEATHER = {
     "Sunny":  "#FDB813",  # soft yellow-orange
@@ -89,6 +127,9 @@ COLOR_VEH = {
     "Car":     "#499894",  # teal
 }
 
+# above this many rows the scatter tab draws a density grid instead of points
+SCATTER_MAX_POINTS = 20_000
+
 def palette_for(column):
     return {
         "Weather": COLOR_WEATHER,
@@ -99,32 +140,83 @@ def palette_for(column):
 
 # Sidebar filters
 st.sidebar.markdown("### Filters")
-w_opts  = sorted(df["Weather"].dropna().unique())
-t_opts  = sorted(df["Traffic_Level"].dropna().unique())
-tod_opts= sorted(df["Time_of_Day"].dropna().unique())
-v_opts  = sorted(df["Vehicle_Type"].dropna().unique())
+
+@st.cache_data(show_spinner=False)
+def sidebar_options(_df, src, data_version):
+    # categories + bounds only change with the dataset, not per rerun
+    return dict(
+        w=sorted(_df["Weather"].cat.categories),
+        t=sorted(_df["Traffic_Level"].cat.categories),
+        tod=sorted(_df["Time_of_Day"].cat.categories),
+        v=sorted(_df["Vehicle_Type"].cat.categories),
+        dist_min=float(_df["Distance_km"].min()), dist_max=float(_df["Distance_km"].max()),
+        exp_min=float(_df["Courier_Experience_yrs"].min()), exp_max=float(_df["Courier_Experience_yrs"].max()),
+    )
+
+opts = sidebar_options(df, src, data_version)
+w_opts, t_opts, tod_opts, v_opts = opts["w"], opts["t"], opts["tod"], opts["v"]
 
 weather_sel = st.sidebar.multiselect("Weather", w_opts, default=w_opts)
 traffic_sel = st.sidebar.multiselect("Traffic Level", t_opts, default=t_opts)
 tod_sel     = st.sidebar.multiselect("Time of Day", tod_opts, default=tod_opts)
 vehicle_sel = st.sidebar.multiselect("Vehicle Type", v_opts, default=v_opts)
 
-dist_min, dist_max = float(df["Distance_km"].min()), float(df["Distance_km"].max())
-exp_min, exp_max   = float(df["Courier_Experience_yrs"].min()), float(df["Courier_Experience_yrs"].max())
+dist_min, dist_max = opts["dist_min"], opts["dist_max"]
+exp_min, exp_max   = opts["exp_min"], opts["exp_max"]
 dist_range = st.sidebar.slider("Distance (km)", min_value=0.0, max_value=float(np.ceil(dist_max)),
                                value=(dist_min, dist_max), step=0.5)
 exp_range  = st.sidebar.slider("Courier Experience (yrs)",
                                min_value=0.0, max_value=float(np.ceil(max(exp_max,1)) or 1.0),
                                value=(exp_min, exp_max), step=1.0)
 
-dff = df[
-    (df["Weather"].isin(weather_sel)) &
-    (df["Traffic_Level"].isin(traffic_sel)) &
-    (df["Time_of_Day"].isin(tod_sel)) &
-    (df["Vehicle_Type"].isin(vehicle_sel)) &
-    (df["Distance_km"].between(dist_range[0], dist_range[1])) &
-    (df["Courier_Experience_yrs"].between(exp_range[0], exp_range[1]))
-].copy()
+# raw column arrays, pulled out once so the filter works on plain numpy
+cat_codes = {c: df[c].cat.codes.to_numpy() for c in CAT_COLS}
+dist_arr  = df["Distance_km"].to_numpy()
+exp_arr   = df["Courier_Experience_yrs"].to_numpy()
+
+def cat_isin(col, sel):
+    # compare the small integer codes instead of hashing strings per row
+    idx = df[col].cat.categories.get_indexer(sel)
+    return np.isin(cat_codes[col], idx[idx >= 0])
+
+def range_mask(a, lo, hi):
+    # both bounds written into one bool buffer, no extra and-ed temporary
+    out = np.greater_equal(a, lo)
+    return np.logical_and(out, np.less_equal(a, hi), out=out)
+
+def build_mask(weather_sel, traffic_sel, tod_sel, vehicle_sel, dist_range, exp_range):
+    return np.logical_and.reduce((
+        cat_isin("Weather", weather_sel),
+        cat_isin("Traffic_Level", traffic_sel),
+        cat_isin("Time_of_Day", tod_sel),
+        cat_isin("Vehicle_Type", vehicle_sel),
+        range_mask(dist_arr, *dist_range),
+        range_mask(exp_arr, *exp_range),
+    ))
+
+delivery_arr = df["Delivery_Time_min"].to_numpy()
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def kpis(data_version, weather_sel, traffic_sel, tod_sel, vehicle_sel, dist_range, exp_range):
+    # mean/p50/p90/count in one go, cached per dataset + filter selection
+    a = delivery_arr[build_mask(weather_sel, traffic_sel, tod_sel, vehicle_sel, dist_range, exp_range)]
+    p50, p90 = np.percentile(a, [50, 90])
+    return float(a.mean(dtype=np.float64)), float(p50), float(p90), int(a.size)
+
+# sidebar selection per category column, looked up by name in the tabs
+cat_sel = {
+    "Weather": weather_sel, "Traffic_Level": traffic_sel,
+    "Time_of_Day": tod_sel, "Vehicle_Type": vehicle_sel,
+}
+
+# hashable, order-independent key for everything downstream of the sidebar
+filter_sig = (
+    tuple(sorted(weather_sel)), tuple(sorted(traffic_sel)),
+    tuple(sorted(tod_sel)), tuple(sorted(vehicle_sel)),
+    tuple(dist_range), tuple(exp_range),
+)
+mask = build_mask(*filter_sig)
+dff = df.iloc[mask]  # read-only downstream, no copy needed
 
 st.sidebar.success(f"Rows: {len(dff)}")
 if dff.empty:
@@ -135,27 +227,28 @@ if dff.empty:
 st.markdown("## 🛵 Food Delivery Times")
 st.caption("Source: Food_Delivery_Times_CLEAN.csv")
 
+mean_t, p50_t, p90_t, n_rows = kpis(data_version, *filter_sig)
 c1, c2, c3, c4 = st.columns(4)
-c1.metric("Mean",   f"{dff['Delivery_Time_min'].mean():.1f} min")
-c2.metric("Median", f"{dff['Delivery_Time_min'].median():.1f} min")
-c3.metric("p90",    f"{dff['Delivery_Time_min'].quantile(0.9):.1f} min")
-c4.metric("Count",  f"{len(dff)}")
+c1.metric("Mean",   f"{mean_t:.1f} min")
+c2.metric("Median", f"{p50_t:.1f} min")
+c3.metric("p90",    f"{p90_t:.1f} min")
+c4.metric("Count",  f"{n_rows}")
 
 st.divider()
 
-# Tabs 
-tab1, tab2, tab3, tab4, tab5 = st.tabs(
-    ["Distribution", "Boxplot", "Scatter + Trendline", "Correlation", "Table"]
-)
+# Tab bodies run as fragments: their own widgets only rerun that tab
 
 # 1 Distribution
-with tab1:
+@st.fragment
+def render_tab1(dff):
     left, right = st.columns([2,1])
     with left:
-        fig = px.histogram(
-            dff, x="Delivery_Time_min", nbins=30, opacity=0.95,
-            color_discrete_sequence=["#4C78A8"]  # soft blue
-        )
+        # bin on the server, the browser only gets 30 bars
+        counts, edges = np.histogram(dff["Delivery_Time_min"].to_numpy(), bins=30)
+        fig = go.Figure(go.Bar(
+            x=(edges[:-1] + edges[1:]) / 2, y=counts,
+            opacity=0.95, marker_color="#4C78A8"  # soft blue
+        ))
         fig.update_layout(
             title="Distribution of Delivery_Time_min",
             xaxis_title="Delivery Time (minutes)", yaxis_title="Count",
@@ -171,16 +264,53 @@ with tab1:
         )
 
 # 2 Boxplot by Category
-with tab2:
+@st.cache_data(show_spinner=False, max_entries=16)
+def box_stats(data_version, filter_sig, cat):
+    # one masked pass over the cached arrays, split by category code
+    mask = build_mask(*filter_sig)
+    codes, a = cat_codes[cat][mask], delivery_arr[mask]
+    stats = {}
+    for i, k in enumerate(df[cat].cat.categories):
+        g = a[codes == i]
+        if g.size == 0:
+            continue
+        q1, med, q3 = np.percentile(g, [25, 50, 75], method="hazen")  # plotly.js box quartiles
+        lo, hi = q1 - 1.5 * (q3 - q1), q3 + 1.5 * (q3 - q1)
+        inside = g[(g >= lo) & (g <= hi)]
+        stats[k] = dict(
+            q1=float(q1), median=float(med), q3=float(q3),
+            lowerfence=float(inside.min()), upperfence=float(inside.max()),
+            outliers=g[(g < lo) | (g > hi)],
+        )
+    return stats
+
+def box_traces(stats, order, palette):
+    # quartiles + Tukey fences per category, only outliers ship as raw points
+    traces = []
+    for i, k in enumerate(order):
+        if k not in stats:
+            continue
+        box = stats[k]
+        color = palette.get(k, px.colors.qualitative.Plotly[i % len(px.colors.qualitative.Plotly)])
+        traces.append(go.Box(
+            name=k, x=[k], q1=[box["q1"]], median=[box["median"]], q3=[box["q3"]],
+            lowerfence=[box["lowerfence"]], upperfence=[box["upperfence"]],
+            marker_color=color, legendgroup=k
+        ))
+        if box["outliers"].size:
+            traces.append(go.Scatter(
+                x=[k] * box["outliers"].size, y=box["outliers"], mode="markers",
+                marker_color=color, legendgroup=k, showlegend=False
+            ))
+    return traces
+
+@st.fragment
+def render_tab2(data_version, filter_sig, cat_sel):
     cat = st.selectbox("Select a category:", ["Weather","Traffic_Level","Time_of_Day","Vehicle_Type"])
     palette = palette_for(cat)
-    # make sure the legend order is stable
-    category_order = sorted(dff[cat].dropna().unique())
-    fig2 = px.box(
-        dff, x=cat, y="Delivery_Time_min", color=cat,
-        category_orders={cat: category_order},
-        color_discrete_map=palette
-    )
+    # make sure the legend order is stable; skip categories filtered out in the sidebar
+    category_order = [c for c in CATEGORY_ORDERS[cat] if c in cat_sel[cat]]
+    fig2 = go.Figure(box_traces(box_stats(data_version, filter_sig, cat), category_order, palette))
     fig2.update_layout(
         title=f"Delivery Time vs {cat}",
         xaxis_title=cat, yaxis_title="Delivery Time (minutes)",
@@ -189,24 +319,56 @@ with tab2:
     st.plotly_chart(fig2, use_container_width=True)
 
 # 3 Scatter + Trendline
-with tab3:
+def trend_line(x, y, color, **kw):
+    # least-squares line over the x range (same fit as px trendline="ols")
+    if x.size < 2 or x.min() == x.max():
+        return go.Scatter(x=[], y=[], showlegend=False)
+    m, b = np.polyfit(x, y, 1)
+    lo, hi = x.min(), x.max()
+    return go.Scatter(
+        x=[lo, hi], y=[m * lo + b, m * hi + b], mode="lines",
+        line_color=color, showlegend=False, hoverinfo="skip", **kw
+    )
+
+@st.fragment
+def render_tab3(dff):
     left, right = st.columns([3,2])
     with left:
         xopt = st.selectbox("X axis:", ["Distance_km","Courier_Experience_yrs"], index=0)
         color_by = st.selectbox("Color by (optional):", [None,"Weather","Traffic_Level","Time_of_Day","Vehicle_Type"], index=0)
-        if color_by:
-            cmap = palette_for(color_by)
-            fig3 = px.scatter(
-                dff, x=xopt, y="Delivery_Time_min",
-                opacity=0.6, trendline="ols",
-                color=color_by, color_discrete_map=cmap
+        if len(dff) > SCATTER_MAX_POINTS:
+            # too many points for the browser: bin into a density grid instead
+            x = dff[xopt].to_numpy()
+            y = dff["Delivery_Time_min"].to_numpy()
+            counts, xe, ye = np.histogram2d(x, y, bins=(150, 100))
+            counts[counts == 0] = np.nan  # leave empty cells blank
+            fig3 = px.imshow(
+                counts.T, x=(xe[:-1] + xe[1:]) / 2, y=(ye[:-1] + ye[1:]) / 2,
+                origin="lower", aspect="auto", color_continuous_scale="Blues",
+                labels={"color": "Count"}
             )
+            fig3.add_trace(trend_line(x, y, "#E15759"))
+            if color_by:
+                st.caption(f"{len(dff)} rows: showing point density, color by {color_by} is skipped.")
         else:
-            fig3 = px.scatter(
-                dff, x=xopt, y="Delivery_Time_min",
-                opacity=0.6, trendline="ols",
-                color_discrete_sequence=["#E15759"]  # soft red
-            )
+            if color_by:
+                cmap = palette_for(color_by)
+                fig3 = px.scatter(
+                    dff, x=xopt, y="Delivery_Time_min",
+                    opacity=0.6, render_mode="webgl",
+                    color=color_by, color_discrete_map=cmap
+                )
+            else:
+                fig3 = px.scatter(
+                    dff, x=xopt, y="Delivery_Time_min",
+                    opacity=0.6, render_mode="webgl",
+                    color_discrete_sequence=["#E15759"]  # soft red
+                )
+            # one fitted line per point trace, in that trace's color
+            for tr in list(fig3.data):
+                fig3.add_trace(trend_line(
+                    np.asarray(tr.x), np.asarray(tr.y), tr.marker.color, legendgroup=tr.legendgroup
+                ))
         fig3.update_layout(
             title=f"Delivery Time vs {xopt}",
             xaxis_title=xopt, yaxis_title="Delivery Time (minutes)"
@@ -221,12 +383,19 @@ with tab3:
         
 
 # 4 Correlation Heatmap
-with tab4:
+@st.fragment
+def render_tab4(dff):
     use_cols = ["Distance_km","Courier_Experience_yrs","Delivery_Time_min"]
-    corr = dff[use_cols].corr()
+    arr = np.column_stack([dff[c].to_numpy(np.float32) for c in use_cols])
+    arr = arr[~np.isnan(arr).any(axis=1)]
+    # a constant column (e.g. a single-value slider) has no correlation: keep it NaN
+    with np.errstate(invalid="ignore", divide="ignore"):
+        corr = np.corrcoef(arr, rowvar=False)
+    # drop float rounding like 0.9999999 on the diagonal
+    corr[np.diag_indices_from(corr)] = np.where(np.isfinite(np.diag(corr)), 1.0, np.nan)
     # safe diverging palette (blue-white-red) for clear contrast
     fig4 = px.imshow(
-        corr, text_auto=True, zmin=-1, zmax=1,
+        corr, x=use_cols, y=use_cols, text_auto=True, zmin=-1, zmax=1,
         color_continuous_scale="RdBu",
         aspect="auto"
     )
@@ -234,13 +403,39 @@ with tab4:
     st.plotly_chart(fig4, use_container_width=True)
 
 # 5 Table
-with tab5:
+@st.cache_data(show_spinner=False, max_entries=16)
+def to_csv_bytes(data_version, filter_sig, _dff):
+    # CSV encoding is the slow part, only redo it when the filters change
+    # whole-number columns were only widened to float32 in memory: export them as ints again
+    ints = {c: "int64" for c in INT_COLS if np.all(np.mod(_dff[c].to_numpy(), 1) == 0)}
+    return _dff.astype(ints).to_csv(index=False).encode("utf-8")
+
+@st.fragment
+def render_tab5(dff, data_version, filter_sig):
     st.markdown("**Filtered data (top 200 rows for preview)**")
-    st.dataframe(dff.head(200), use_container_width=True)
+    # keep the preview slice across reruns until the filters change
+    if st.session_state.get("tbl_key") != (data_version, filter_sig):
+        st.session_state["tbl"] = dff.head(200)
+        st.session_state["tbl_key"] = (data_version, filter_sig)
+    st.dataframe(st.session_state["tbl"], use_container_width=True)
     st.download_button(
         "Download filtered CSV",
-        data=dff.to_csv(index=False).encode("utf-8"),
+        data=to_csv_bytes(data_version, filter_sig, dff),
         file_name="filtered_food_delivery_times.csv",
         mime="text/csv"
     )
 
+# Tabs 
+tab1, tab2, tab3, tab4, tab5 = st.tabs(
+    ["Distribution", "Boxplot", "Scatter + Trendline", "Correlation", "Table"]
+)
+with tab1:
+    render_tab1(dff)
+with tab2:
+    render_tab2(data_version, filter_sig, cat_sel)
+with tab3:
+    render_tab3(dff)
+with tab4:
+    render_tab4(dff)
+with tab5:
+    render_tab5(dff, data_version, filter_sig)